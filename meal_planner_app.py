@@ -1,11 +1,14 @@
 import streamlit as st
 from datetime import datetime
-import pandas as pd
-from PIL import Image, ImageDraw, ImageFont
+import numpy as np
+import functools
 import io
-import math
-from collections import defaultdict
 import json
+from itertools import chain
+
+# pandas and Pillow are imported inside the functions that need them:
+# Streamlit re-executes this module on every rerun, and neither library
+# is needed just to show the planning UI.
 
 # --- App Configuration ---
 st.set_page_config(
@@ -16,13 +19,45 @@ st.set_page_config(
 
 date_today = datetime.today().strftime('%Y-%m-%d')
 
+DAYS_OF_WEEK = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+MEAL_TYPES = ["Breakfast", "Lunch", "Dinner"]
+
+# --- Timetable image layout ---
+# Everything the static grid depends on lives here so the cached base
+# image and the per-plan cell fill agree on the geometry.
+IMG_WIDTH = 1800
+IMG_BG_COLOR = "white"
+IMG_FONT_COLOR = "black"
+IMG_DIFFICULTY_COLOR = "#555555"
+IMG_HEADER_COLOR = "#F0F2F6"
+IMG_LINE_COLOR = "#DDDDDD"
+GRID_START_X, GRID_START_Y = 50, 150
+GRID_HEIGHT = 750  # Height for the meal grid itself
+COL_WIDTH = (IMG_WIDTH - 2 * GRID_START_X) / (len(DAYS_OF_WEEK) + 0.5)
+ROW_HEIGHT = GRID_HEIGHT / (len(MEAL_TYPES) + 1)
+GRID_BOTTOM = GRID_START_Y + ROW_HEIGHT * (len(MEAL_TYPES) + 1)
+# Height of the static part (title + grid); the full canvas is sized to
+# its content at render time, growing only when there are prep notes.
+BASE_IMG_HEIGHT = int(GRID_BOTTOM) + 50
+
 # --- Helper Functions ---
 
+@st.cache_data
 def load_meals(filepath="meals.json"):
-    """Loads the meal database from a JSON file."""
+    """Loads the meal database from a JSON file (cached across reruns)."""
     try:
         with open(filepath, 'r') as f:
-            return json.load(f)
+            meals = json.load(f)
+        # Keep each meal's ingredients as parallel arrays (structure of
+        # arrays) alongside the original dicts, so quantity math and the
+        # ingredients DataFrame work on whole arrays per meal instead of
+        # one small dict at a time.
+        for meal in meals:
+            ingredients = meal['ingredients']
+            meal['_qty'] = np.asarray([ing['quantity'] for ing in ingredients], dtype=np.float64)
+            meal['_items'] = [ing['item'] for ing in ingredients]
+            meal['_units'] = [ing['unit'] for ing in ingredients]
+        return meals
     except FileNotFoundError:
         st.error(f"Error: The `{filepath}` file was not found. Please create it in the same directory as the script.")
         return []
@@ -30,135 +65,298 @@ def load_meals(filepath="meals.json"):
         st.error(f"Error: The `{filepath}` file is not a valid JSON. Please check its syntax.")
         return []
 
-def get_meal_by_name(name, meals_db):
-    """Finds a meal in the MEALS list by its name."""
-    for meal in meals_db:
-        if meal['name'] == name:
-            return meal
-    return None
-
-def create_meal_plan_image(plan, prep_list):
-    """Generates an image of the weekly meal plan timetable with meal prep notes."""
-    width, height = 1800, 1200  # Increased height for notes section
-    bg_color = "white"
-    font_color = "black"
-    difficulty_color = "#555555"
-    header_color = "#F0F2F6"
-    line_color = "#DDDDDD"
-
-    image = Image.new("RGB", (width, height), bg_color)
-    draw = ImageDraw.Draw(image)
+def get_meal_by_name(name):
+    """Looks up a meal by its name via the precomputed index."""
+    return MEALS_BY_NAME.get(name)
+
+@st.cache_data
+def build_meal_options(meals, meal_types):
+    """Precomputes the selectbox option lists for each meal type and for salads."""
+    options_by_type = {
+        mt: ["-"] + [m['name'] for m in meals if mt in m['type'] and not m.get('is_salad', False)]
+        for mt in meal_types
+    }
+    salad_options = ["-"] + [m['name'] for m in meals if m.get('is_salad', False)]
+    return options_by_type, salad_options
+
+@st.cache_data
+def build_recipes_markdown(meals):
+    """Pre-renders the meal database as a single markdown block.
+
+    One st.markdown call sends one message to the frontend instead of
+    half a dozen per meal, and the string is cached across reruns.
+    """
+    parts = []
+    for meal in meals:
+        meal_prep_text = "Yes" if meal.get('meal_prep', False) else "No"
+        is_salad_text = "Yes" if meal.get('is_salad', False) else "No"
+        parts.append(f"### {meal['name']} ({', '.join(meal['type'])})")
+        parts.append(f"**Difficulty:** {meal['difficulty']} | **Salad:** {is_salad_text} | **Can be Meal-Prepped:** {meal_prep_text}")
+        parts.append("**Ingredients:**")
+        parts.append("\n".join(f"- {ing['item']}: {ing['quantity']} {ing['unit']}" for ing in meal['ingredients']))
+        parts.append(f"**Recipe:** {meal['recipe']}")
+        parts.append("---")
+    return "\n\n".join(parts)
+
+@st.cache_data
+def build_ingredients_df(meals):
+    """Flattens every meal's ingredient arrays into one DataFrame."""
+    import pandas as pd
+
+    columns = ['meal', 'item', 'quantity', 'unit', 'default_portions']
+    if not meals:
+        return pd.DataFrame(columns=columns)
+
+    # The per-meal arrays from load_meals assemble column-wise, so no
+    # per-ingredient Python rows are built.
+    counts = [len(meal['_items']) for meal in meals]
+    return pd.DataFrame({
+        'meal': np.repeat([meal['name'] for meal in meals], counts),
+        'item': list(chain.from_iterable(meal['_items'] for meal in meals)),
+        'quantity': np.concatenate([meal['_qty'] for meal in meals]),
+        'unit': list(chain.from_iterable(meal['_units'] for meal in meals)),
+        'default_portions': np.repeat([meal.get('default_portions', 1) for meal in meals], counts),
+    }, columns=columns)
+
+@st.cache_resource
+def load_fonts():
+    """Loads the fonts used by the timetable image once per process."""
+    from PIL import ImageFont
 
     try:
         # Use a built-in font or specify a path to a .ttf file
-        title_font = ImageFont.truetype("arial.ttf", 50)
-        header_font = ImageFont.truetype("arialbd.ttf", 35)
-        cell_font = ImageFont.truetype("arial.ttf", 30)
-        difficulty_font = ImageFont.truetype("arial.ttf", 24)
-        notes_title_font = ImageFont.truetype("arialbd.ttf", 32)
-        notes_font = ImageFont.truetype("arial.ttf", 28)
+        return {
+            'title': ImageFont.truetype("arial.ttf", 50),
+            'header': ImageFont.truetype("arialbd.ttf", 35),
+            'cell': ImageFont.truetype("arial.ttf", 30),
+            'difficulty': ImageFont.truetype("arial.ttf", 24),
+            'notes_title': ImageFont.truetype("arialbd.ttf", 32),
+            'notes': ImageFont.truetype("arial.ttf", 28),
+        }
     except IOError:
         # Fallback to default font if arial is not found
-        title_font = ImageFont.load_default()
-        header_font = ImageFont.load_default()
-        cell_font = ImageFont.load_default()
-        difficulty_font = ImageFont.load_default()
-        notes_title_font = ImageFont.load_default()
-        notes_font = ImageFont.load_default()
+        default_font = ImageFont.load_default()
+        return {name: default_font for name in
+                ('title', 'header', 'cell', 'difficulty', 'notes_title', 'notes')}
+
+# Fonts are registered here by id so the character-width cache below can
+# key on a hashable value instead of the font object itself.
+_FONTS_BY_ID = {}
+
+def _register_font(font):
+    """Registers a font object and returns the id used as its cache key."""
+    font_id = id(font)
+    _FONTS_BY_ID[font_id] = font
+    return font_id
+
+@functools.lru_cache(maxsize=None)
+def _char_width(font_id, ch):
+    """Returns the width of a single character, measured once per font."""
+    return _FONTS_BY_ID[font_id].getbbox(ch)[2]
+
+def _text_width(font_id, text):
+    """Approximates text width as the sum of cached per-character widths."""
+    return sum(_char_width(font_id, ch) for ch in text)
+
+def _line_height(font):
+    """Returns the fixed line height (ascent + descent) for a font."""
+    try:
+        ascent, descent = font.getmetrics()
+    except AttributeError:
+        # Bitmap fallback fonts have no getmetrics(); measure once instead.
+        ascent, descent = font.getbbox("Ay")[3], 0
+    return ascent + descent
+
+def wrap_text(text, font, max_width):
+    """Wraps text to fit max_width, measuring the font as little as possible.
+
+    Estimates how many characters fit on a line from the width of a single
+    character, jumps ahead by that many, then corrects at the boundary.
+    Widths come from the per-character cache, so each glyph hits FreeType
+    at most once per font.
+    """
+    font_id = _register_font(font)
+    char_width = _char_width(font_id, "a") or 1
+    estimate = max(1, int(max_width // char_width))
+    lines = []
+    i, n = 0, len(text)
+    while i < n:
+        j = min(i + estimate, n)
+        width = _text_width(font_id, text[i:j])
+        if width <= max_width:
+            while j < n and width + _char_width(font_id, text[j]) <= max_width:
+                width += _char_width(font_id, text[j])
+                j += 1
+        else:
+            while j > i + 1 and width > max_width:
+                j -= 1
+                width -= _char_width(font_id, text[j])
+        # Back up to the last word boundary, unless the line is a single
+        # very long word that has to be broken mid-word.
+        if j < n and not text[j].isspace():
+            last_space = text.rfind(' ', i, j)
+            if last_space > i:
+                j = last_space
+        lines.append(text[i:j].strip())
+        i = j
+        while i < n and text[i] == ' ':
+            i += 1
+    return lines
+
+@functools.lru_cache(maxsize=None)
+def _render_name_bitmap(name, font_id, max_width):
+    """Rasterizes a wrapped meal name once; repeat cells paste the pixels.
+
+    Returns (bitmap, line_count). The bitmap has a transparent background
+    so it can be alpha-composited into any cell, and the same meal
+    appearing several times per week (or across renders) is only shaped
+    through FreeType once.
+    """
+    from PIL import Image, ImageDraw
+
+    font = _FONTS_BY_ID[font_id]
+    lines = wrap_text(name, font, max_width)
+    line_height = _line_height(font) + 5
+    bitmap = Image.new("RGBA", (int(max_width), max(1, len(lines) * line_height)), (0, 0, 0, 0))
+    ImageDraw.Draw(bitmap).multiline_text((0, 0), "\n".join(lines), fill=IMG_FONT_COLOR, font=font, spacing=5)
+    return bitmap, len(lines)
+
+@st.cache_resource
+def base_plan_image():
+    """Renders the static timetable background (title, headers, grid) once.
+
+    Everything drawn here depends only on the layout constants, so the
+    empty grid is built a single time per process and copied for each
+    plan render.
+    """
+    from PIL import Image, ImageDraw
+
+    fonts = load_fonts()
+    title_font = fonts['title']
+    header_font = fonts['header']
+
+    image = Image.new("RGB", (IMG_WIDTH, BASE_IMG_HEIGHT), IMG_BG_COLOR)
+    draw = ImageDraw.Draw(image)
 
     # Title
-    draw.text((width/2, 60), "Weekly Meal Plan", fill=font_color, font=title_font, anchor="ms")
-
-    # Grid setup
-    days = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
-    meals_of_day = ["Breakfast", "Lunch", "Dinner"]
-    
-    start_x, start_y = 50, 150
-    grid_height = 750 # Height for the meal grid itself
-    col_width = (width - 2 * start_x) / (len(days) + 0.5)
-    row_height = grid_height / (len(meals_of_day) + 1)
-    
+    draw.text((IMG_WIDTH/2, 60), "Weekly Meal Plan", fill=IMG_FONT_COLOR, font=title_font, anchor="ms")
+
     # Draw header row for days
-    for i, day in enumerate(days):
-        x = start_x + col_width * (i + 0.5)
+    for i, day in enumerate(DAYS_OF_WEEK):
+        x = GRID_START_X + COL_WIDTH * (i + 0.5)
         draw.rectangle(
-            [x, start_y, x + col_width, start_y + row_height],
-            fill=header_color
+            [x, GRID_START_Y, x + COL_WIDTH, GRID_START_Y + ROW_HEIGHT],
+            fill=IMG_HEADER_COLOR
         )
-        draw.text((x + col_width/2, start_y + row_height/2), day, fill=font_color, font=header_font, anchor="mm")
+        draw.text((x + COL_WIDTH/2, GRID_START_Y + ROW_HEIGHT/2), day, fill=IMG_FONT_COLOR, font=header_font, anchor="mm")
 
     # Draw header column for meal types
-    for j, meal_type in enumerate(meals_of_day):
-        y = start_y + row_height * (j + 1)
+    for j, meal_type in enumerate(MEAL_TYPES):
+        y = GRID_START_Y + ROW_HEIGHT * (j + 1)
         draw.rectangle(
-            [start_x, y, start_x + col_width * 0.5, y + row_height],
-            fill=header_color
+            [GRID_START_X, y, GRID_START_X + COL_WIDTH * 0.5, y + ROW_HEIGHT],
+            fill=IMG_HEADER_COLOR
         )
-        draw.text((start_x + col_width*0.25, y + row_height/2), meal_type, fill=font_color, font=header_font, anchor="mm")
-
-    # Draw grid lines and fill cells
-    grid_bottom = start_y + row_height * (len(meals_of_day) + 1)
-    for i in range(len(days) + 1):
-        x = start_x + col_width * (i + 0.5)
-        draw.line([x, start_y, x, grid_bottom], fill=line_color, width=2)
-    
-    for j in range(len(meals_of_day) + 2):
-        y = start_y + row_height * j
-        draw.line([start_x, y, width - start_x, y], fill=line_color, width=2)
-
-    # Helper for wrapping text
-    def wrap_text(text, font, max_width):
-        lines = []
-        words = text.split(' ')
-        while words:
-            line = ''
-            while words and font.getbbox(line + words[0])[2] <= max_width:
-                line += words.pop(0) + ' '
-            if not line and words: # Handle single very long word
-                line = words.pop(0) + ' '
-            lines.append(line.strip())
-        return lines
+        draw.text((GRID_START_X + COL_WIDTH*0.25, y + ROW_HEIGHT/2), meal_type, fill=IMG_FONT_COLOR, font=header_font, anchor="mm")
+
+    # Grid lines: paste two precomputed 2px strips at each position, which
+    # is a plain pixel copy instead of a draw call per line.
+    vstrip = Image.new("RGB", (2, int(GRID_BOTTOM - GRID_START_Y)), IMG_LINE_COLOR)
+    hstrip = Image.new("RGB", (IMG_WIDTH - 2 * GRID_START_X, 2), IMG_LINE_COLOR)
+
+    for i in range(len(DAYS_OF_WEEK) + 1):
+        x = GRID_START_X + COL_WIDTH * (i + 0.5)
+        image.paste(vstrip, (int(x), GRID_START_Y))
+
+    for j in range(len(MEAL_TYPES) + 2):
+        y = GRID_START_Y + ROW_HEIGHT * j
+        image.paste(hstrip, (GRID_START_X, int(y)))
+
+    return image
+
+def create_meal_plan_image(plan, prep_list):
+    """Generates an image of the weekly meal plan timetable with meal prep notes."""
+    from PIL import Image, ImageDraw
+
+    fonts = load_fonts()
+    cell_font = fonts['cell']
+    difficulty_font = fonts['difficulty']
+    notes_title_font = fonts['notes_title']
+    notes_font = fonts['notes']
+
+    # Line heights never change per font, so compute them once instead of
+    # asking for a bounding box on every drawn line.
+    cell_line_height = _line_height(cell_font) + 5
+    notes_line_height = _line_height(notes_font) + 10
+
+    # Measure the notes block up front so the canvas can be allocated at
+    # its final size; the old fixed 1800x1200 canvas left the bottom half
+    # blank whenever there were no notes.
+    wrapped_notes = []
+    if prep_list:
+        notes_text = "The following meals can be prepared in advance: " + ", ".join(prep_list)
+        wrapped_notes = wrap_text(notes_text, notes_font, IMG_WIDTH - (2 * GRID_START_X))
+
+    height = BASE_IMG_HEIGHT
+    if wrapped_notes:
+        height = int(GRID_BOTTOM) + 100 + len(wrapped_notes) * notes_line_height + 50
+
+    # Start from the cached empty grid and only draw the per-plan content.
+    image = Image.new("RGB", (IMG_WIDTH, height), IMG_BG_COLOR)
+    image.paste(base_plan_image(), (0, 0))
+    draw = ImageDraw.Draw(image)
 
     # Fill in the plan
     cell_padding = 15
-    for i, day in enumerate(days):
-        for j, meal_type in enumerate(meals_of_day):
+    for i, day in enumerate(DAYS_OF_WEEK):
+        for j, meal_type in enumerate(MEAL_TYPES):
             meal_info = plan.get(day, {}).get(meal_type)
             if meal_info and 'name' in meal_info:
                 meal_name = meal_info['name']
                 difficulty = f"({meal_info['difficulty']})"
-                
-                x = start_x + col_width * (i + 0.5) + cell_padding
-                y = start_y + row_height * (j + 1) + cell_padding
-                
-                # Wrap and draw meal name
-                wrapped_name_lines = wrap_text(meal_name, cell_font, col_width - (2 * cell_padding))
-                for line in wrapped_name_lines:
-                    draw.text((x, y), line, fill=font_color, font=cell_font)
-                    y += cell_font.getbbox(line)[3] + 5
-                
-                draw.text((x, y + 5), difficulty, fill=difficulty_color, font=difficulty_font)
+
+                x = GRID_START_X + COL_WIDTH * (i + 0.5) + cell_padding
+                y = GRID_START_Y + ROW_HEIGHT * (j + 1) + cell_padding
+
+                # Paste the cached bitmap for this meal name; rendering
+                # only happens the first time a name is seen.
+                name_bitmap, line_count = _render_name_bitmap(meal_name, _register_font(cell_font), int(COL_WIDTH - 2 * cell_padding))
+                image.paste(name_bitmap, (int(x), int(y)), name_bitmap)
+                y += line_count * cell_line_height
+
+                draw.text((x, y + 5), difficulty, fill=IMG_DIFFICULTY_COLOR, font=difficulty_font)
 
     # Add Meal Prep Notes section at the bottom
-    if prep_list:
-        notes_y_start = grid_bottom + 50
-        draw.text((start_x, notes_y_start), "🍳 Meal Prep Notes", font=notes_title_font, fill=font_color)
-        
-        notes_text = "The following meals can be prepared in advance: " + ", ".join(prep_list)
-        wrapped_notes = wrap_text(notes_text, notes_font, width - (2 * start_x))
-        
-        notes_y = notes_y_start + 50
-        for line in wrapped_notes:
-            draw.text((start_x, notes_y), line, font=notes_font, fill=font_color)
-            notes_y += notes_font.getbbox(line)[3] + 10
+    if wrapped_notes:
+        notes_y_start = GRID_BOTTOM + 50
+        draw.text((GRID_START_X, notes_y_start), "🍳 Meal Prep Notes", font=notes_title_font, fill=IMG_FONT_COLOR)
+
+        draw.multiline_text((GRID_START_X, notes_y_start + 50), "\n".join(wrapped_notes), font=notes_font, fill=IMG_FONT_COLOR, spacing=10)
 
     return image
 
+@st.cache_data
+def render_plan_png(plan_json, prep_tuple):
+    """Renders the plan image to PNG bytes, cached on the plan content.
+
+    Takes the plan as a JSON string and the prep list as a tuple so the
+    cache key is hashable; repeat Generate clicks with an unchanged plan
+    reuse the encoded bytes instead of re-rendering.
+    """
+    plan = json.loads(plan_json)
+    image = create_meal_plan_image(plan, list(prep_tuple))
+    img_byte_arr = io.BytesIO()
+    # The PNG is viewed/downloaded once, so favour encode speed over a
+    # slightly smaller file.
+    image.save(img_byte_arr, format='PNG', optimize=False, compress_level=1)
+    return img_byte_arr.getvalue()
+
 
 # --- Streamlit App UI ---
 
 # Load meal data from the external file
 MEALS = load_meals()
+MEALS_BY_NAME = {meal['name']: meal for meal in MEALS}
 
 st.title("🍲 Weekly Meal Planner")
 
@@ -167,154 +365,142 @@ if MEALS:
 
     # Display the meal database in an expander
     with st.expander("📚 View Available Meals & Recipes"):
-        for meal in MEALS:
-            meal_prep_text = "Yes" if meal.get('meal_prep', False) else "No"
-            is_salad_text = "Yes" if meal.get('is_salad', False) else "No"
-            st.subheader(f"{meal['name']} ({', '.join(meal['type'])})")
-            st.markdown(f"**Difficulty:** {meal['difficulty']} | **Salad:** {is_salad_text} | **Can be Meal-Prepped:** {meal_prep_text}")
-            
-            col1, col2 = st.columns(2)
-            with col1:
-                st.markdown("**Ingredients:**")
-                for ing in meal['ingredients']:
-                    st.write(f"- {ing['item']}: {ing['quantity']} {ing['unit']}")
-            with col2:
-                st.markdown("**Recipe:**")
-                st.write(meal['recipe'])
-            st.markdown("---")
+        st.markdown(build_recipes_markdown(MEALS))
 
     st.header("🗓️ Plan Your Week")
 
-    # Initialize session state for storing selections
-    if 'plan' not in st.session_state:
-        st.session_state.plan = {}
-
-    # Create timetable UI
-    days_of_week = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
-    meal_types = ["Breakfast", "Lunch", "Dinner"]
-    cols = st.columns(len(days_of_week))
-
-    for i, day in enumerate(days_of_week):
-        with cols[i]:
-            st.subheader(day)
-            if day not in st.session_state.plan:
-                st.session_state.plan[day] = {}
-                
-            for meal_type in meal_types:
-                st.markdown(f"**{meal_type}**")
-                meal_options = ["-"] + [m['name'] for m in MEALS if meal_type in m['type'] and not m.get('is_salad', False)]
-                
-                meal_key = f"{day}_{meal_type}_meal"
-                people_key = f"{day}_{meal_type}_people"
-
-                meal_col, people_col = st.columns([3, 1])
-
-                with meal_col:
-                    selected_meal = st.selectbox(f"Select {meal_type}", options=meal_options, key=meal_key, label_visibility="collapsed")
-                
-                with people_col:
-                    num_people = st.number_input(f"People for {meal_type}", min_value=1, value=1, step=1, key=people_key, label_visibility="collapsed")
-                
-                if selected_meal != "-":
-                    st.session_state.plan.setdefault(day, {})[meal_type] = {'name': selected_meal, 'people': num_people}
-                elif meal_type in st.session_state.plan.get(day, {}):
-                    del st.session_state.plan[day][meal_type]
-
-                # Add salad slot for Lunch and Dinner
-                if meal_type in ["Lunch", "Dinner"]:
-                    salad_options = ["-"] + [m['name'] for m in MEALS if m.get('is_salad', False)]
-                    salad_key = f"{day}_{meal_type}_salad"
-                    
-                    selected_salad = st.selectbox("Side Salad", options=salad_options, key=salad_key, help="Optional side salad")
-                    
-                    if selected_salad != "-":
-                         st.session_state.plan.setdefault(day, {}).setdefault(meal_type, {})['salad'] = selected_salad
-                    elif 'salad' in st.session_state.plan.get(day, {}).get(meal_type, {}):
-                        del st.session_state.plan[day][meal_type]['salad']
+    # Create timetable UI; the widgets keep their own values in
+    # st.session_state under their keys, so no extra bookkeeping is
+    # needed per rerun. The form batches all selections into a single
+    # rerun on submit instead of one rerun per widget change.
+    meal_options_by_type, salad_options = build_meal_options(MEALS, MEAL_TYPES)
+
+    with st.form("week_plan"):
+        cols = st.columns(len(DAYS_OF_WEEK))
 
+        for i, day in enumerate(DAYS_OF_WEEK):
+            with cols[i]:
+                st.subheader(day)
+                for meal_type in MEAL_TYPES:
+                    st.markdown(f"**{meal_type}**")
+                    meal_options = meal_options_by_type[meal_type]
+
+                    meal_key = f"{day}_{meal_type}_meal"
+                    people_key = f"{day}_{meal_type}_people"
+
+                    meal_col, people_col = st.columns([3, 1])
+
+                    with meal_col:
+                        st.selectbox(f"Select {meal_type}", options=meal_options, key=meal_key, label_visibility="collapsed")
+
+                    with people_col:
+                        st.number_input(f"People for {meal_type}", min_value=1, value=1, step=1, key=people_key, label_visibility="collapsed")
+
+                    # Add salad slot for Lunch and Dinner
+                    if meal_type in ["Lunch", "Dinner"]:
+                        salad_key = f"{day}_{meal_type}_salad"
+                        st.selectbox("Side Salad", options=salad_options, key=salad_key, help="Optional side salad")
+
+        submitted = st.form_submit_button("Generate Shopping List & Timetable")
 
     # --- Generate Plan & Shopping List ---
     st.header("✅ Generate Your Plan")
 
-    if st.button("Generate Shopping List & Timetable"):
-        
-        shopping_list = defaultdict(lambda: {'quantity': 0, 'units': set()})
+    if submitted:
+
+        selections = []  # (meal_name, num_people) pairs for the shopping list
         final_plan = {}
         prep_list = []
         is_plan_empty = True
 
-        def add_ingredients_to_list(meal_name, num_people):
-            meal_details = get_meal_by_name(meal_name, MEALS)
+        def add_meal_selection(meal_name, num_people):
+            meal_details = get_meal_by_name(meal_name)
             if not meal_details: return
 
             if meal_details.get('meal_prep', False):
                 prep_list.append(meal_details['name'])
 
-            default_portions = meal_details.get('default_portions', 1)
-            scaling_factor = num_people / default_portions
-            
-            for ingredient in meal_details['ingredients']:
-                item = ingredient['item']
-                scaled_quantity = ingredient['quantity'] * scaling_factor
-                shopping_list[item]['quantity'] += scaled_quantity
-                shopping_list[item]['units'].add(ingredient['unit'])
+            selections.append((meal_details['name'], num_people))
 
-        for day, meals in st.session_state.plan.items():
+        # Read the selections straight from the widgets' session state.
+        for day in DAYS_OF_WEEK:
             final_plan[day] = {}
-            for meal_type, selection in meals.items():
-                
-                if 'name' in selection:
+            for meal_type in MEAL_TYPES:
+                selected_meal = st.session_state.get(f"{day}_{meal_type}_meal", "-")
+                num_people = st.session_state.get(f"{day}_{meal_type}_people", 1)
+
+                if selected_meal != "-":
                     is_plan_empty = False
-                    main_meal_name = selection['name']
-                    num_people = selection['people']
-                    main_meal_details = get_meal_by_name(main_meal_name, MEALS)
+                    main_meal_details = get_meal_by_name(selected_meal)
                     if main_meal_details:
-                        final_plan.setdefault(day, {})[meal_type] = {
+                        final_plan[day][meal_type] = {
                             'name': main_meal_details['name'],
                             'difficulty': main_meal_details['difficulty']
                         }
-                        add_ingredients_to_list(main_meal_name, num_people)
+                        add_meal_selection(selected_meal, num_people)
 
-                if 'salad' in selection:
+                selected_salad = st.session_state.get(f"{day}_{meal_type}_salad", "-")
+                if selected_salad != "-":
                     is_plan_empty = False
-                    salad_name = selection['salad']
-                    num_people_salad = selection.get('people', 1) # Assume salad for same num people
-                    add_ingredients_to_list(salad_name, num_people_salad)
+                    add_meal_selection(selected_salad, num_people) # Assume salad for same num people
 
         if is_plan_empty:
             st.warning("Your meal plan is empty! Please select at least one meal.")
+            st.session_state.pop('generated', None)
         else:
             st.balloons()
-            
-            st.subheader("🛒 Your Shopping List")
-            shopping_df_data = []
-            for item, data in sorted(shopping_list.items()):
-                final_quantity = math.ceil(data['quantity'] * 100) / 100
-                units_str = ", ".join(sorted(list(data['units'])))
-                shopping_df_data.append([item, final_quantity, units_str])
-
-            shopping_df = pd.DataFrame(shopping_df_data, columns=["Ingredient", "Quantity", "Unit"])
-            st.dataframe(shopping_df, use_container_width=True, hide_index=True)
-            
+
+            # Scale and sum every selected meal's ingredients in one
+            # merge + groupby instead of a per-ingredient Python loop.
+            import pandas as pd
+
+            scales = pd.DataFrame(selections, columns=['meal', 'people'])
+            merged = scales.merge(build_ingredients_df(MEALS), on='meal')
+            merged['scaled'] = merged['quantity'] * (merged['people'] / merged['default_portions'])
+            shopping_df = (
+                merged.groupby('item', sort=True)
+                .agg(Quantity=('scaled', 'sum'),
+                     Unit=('unit', lambda units: ", ".join(sorted(set(units)))))
+                .reset_index()
+                .rename(columns={'item': 'Ingredient'})
+            )
+            shopping_df['Quantity'] = np.ceil(shopping_df['Quantity'] * 100) / 100
+
             shopping_list_text = "Your Shopping List\n------------------\n"
-            for item, quantity, unit in shopping_df_data:
-                shopping_list_text += f"- {item}: {quantity} {unit}\n"
-            
-            st.download_button("Download Shopping List as TXT", shopping_list_text, f"shopping_list_{date_today}.txt", "text/plain")
-
-            st.subheader("🖼️ Your Timetable")
-            unique_prep_list = sorted(list(set(prep_list)))
-            plan_image = create_meal_plan_image(final_plan, unique_prep_list)
-            
-            img_byte_arr = io.BytesIO()
-            plan_image.save(img_byte_arr, format='PNG')
-            
-            st.image(plan_image)
-            st.download_button("Download Timetable as PNG", img_byte_arr.getvalue(), f"meal_plan_{date_today}.png", "image/png")
-            
-            if prep_list:
-                st.subheader("🍳 Meal Prep Notes")
-                st.write("The following meals can be prepared in advance:")
-                for meal_name in sorted(list(set(prep_list))):
-                    st.markdown(f"- {meal_name}")
+            for row in shopping_df.itertuples(index=False):
+                shopping_list_text += f"- {row.Ingredient}: {row.Quantity} {row.Unit}\n"
+
+            # Keep the results in session state so the render button below
+            # can trigger a rerun without losing the shopping list. The
+            # plan is serialized once; the same string serves as the PNG
+            # cache key and the JSON download payload.
+            st.session_state.generated = {
+                'plan_json': json.dumps(final_plan, sort_keys=True),
+                'prep_list': sorted(set(prep_list)),
+                'shopping_df': shopping_df,
+                'shopping_list_text': shopping_list_text,
+            }
+
+    generated = st.session_state.get('generated')
+    if generated:
+        st.subheader("🛒 Your Shopping List")
+        st.dataframe(generated['shopping_df'], use_container_width=True, hide_index=True)
+        st.download_button("Download Shopping List as TXT", generated['shopping_list_text'], f"shopping_list_{date_today}.txt", "text/plain")
+        st.download_button("Download Plan as JSON", generated['plan_json'], f"meal_plan_{date_today}.json", "application/json")
+
+        st.subheader("🖼️ Your Timetable")
+        # The PNG render is the expensive part, so only produce it once the
+        # user explicitly asks for the timetable image.
+        if st.button("Render Timetable PNG"):
+            st.session_state.render_timetable = True
+        if st.session_state.get('render_timetable'):
+            png_bytes = render_plan_png(generated['plan_json'], tuple(generated['prep_list']))
+            st.image(png_bytes)
+            st.download_button("Download Timetable as PNG", png_bytes, f"meal_plan_{date_today}.png", "image/png")
+
+        if generated['prep_list']:
+            st.subheader("🍳 Meal Prep Notes")
+            st.write("The following meals can be prepared in advance:")
+            for meal_name in generated['prep_list']:
+                st.markdown(f"- {meal_name}")
 